@@ -2,18 +2,107 @@
 
 import os
 import sys
-import glob
+import queue
+import threading
+import importlib
+import functools
 import numpy as np
 import pandas as pd
 import argparse
 import os.path
 from sklearn.metrics import confusion_matrix
-from termcolor import colored
+from utils.term_utils import c
 
 from utils.svm_utils import *
-from models.ExtraTreesModel import ExtraTreesModel
-from models.CnnModel import CnnModel
-from models.MlpModel import MlpModel
+
+# Choice sets shared by the subprogram parsers
+MODEL_TYPE_CHOICES = ["cnn", "mlp", "et"]
+NUM_FEATURES_CHOICES = ["6", "36", "4032"]
+DTYPE_CHOICES = ["fp16", "fp32"]
+
+# Maps the CLI dtype names to numpy dtypes
+FEATURE_DTYPES = {
+    "fp16": np.float16,
+    "fp32": np.float32
+}
+
+def resolve_feature_dtype(args):
+    """
+    Resolves the numpy dtype to store the feature arrays in. When no
+    --dtype was given, the CNN defaults to half precision (its accuracy
+    is insensitive to it for this data and it halves the bytes moved),
+    while the scikit-learn models keep fp32.
+
+    Args:
+        args: The object that contains all the parsed CLI arguments.
+
+    Returns:
+        The numpy dtype for the feature arrays.
+    """
+
+    dtype_name = getattr(args, "feature_dtype", None)
+
+    if dtype_name is None:
+        dtype_name = "fp16" if args.model_type == "cnn" else "fp32"
+
+    return FEATURE_DTYPES[dtype_name]
+
+# Maps each model type to the module and class implementing it. The modules
+# are imported lazily in build_model: importing the CNN drags in the whole
+# keras/tensorflow stack, which costs seconds of startup and hundreds of MB
+# even for --help or an et/mlp run that never touches it.
+MODEL_REGISTRY = {
+    "et": ("models.ExtraTreesModel", "ExtraTreesModel"),
+    "mlp": ("models.MlpModel", "MlpModel"),
+    "cnn": ("models.CnnModel", "CnnModel")
+}
+
+def build_model(args, input_dict=None):
+    """
+    Instantiates the model matching the model type in the parsed CLI
+    arguments, importing only the module that implements it. The CNN
+    preprocesses its input at construction, so the input dictionary is
+    forwarded to it when one is given.
+
+    Args:
+        args: The object that contains all the parsed CLI arguments.
+        input_dict: The input data dictionary, when already read.
+
+    Returns:
+        The instantiated model.
+    """
+
+    module_name, class_name = MODEL_REGISTRY[args.model_type]
+    model_class = getattr(importlib.import_module(module_name), class_name)
+
+    if args.model_type == "cnn" and input_dict is not None:
+        return model_class(in_dict=input_dict)
+
+    return model_class()
+
+@functools.lru_cache(maxsize=None)
+def load_cached_model(model_path, model_type):
+    """
+    Loads the model stored at the passed path, caching the loaded
+    instance per (path, type) pair. Repeated test/predict calls within
+    the same process reuse the already-loaded model with hot weights
+    instead of deserializing it again.
+
+    Args:
+        model_path: Path of the serialized model file.
+        model_type: The type of the model to load.
+
+    Returns:
+        The loaded model.
+    """
+
+    module_name, class_name = MODEL_REGISTRY[model_type]
+    model_class = getattr(importlib.import_module(module_name), class_name)
+
+    model = model_class()
+    model.load_model(model_path)
+
+    return model
 
 ## Script entry point
 def main():
@@ -42,12 +131,13 @@ def parse_arguments():
     parser_train_optional_args = parser_train.add_argument_group("Optional arguments")
     parser_train_required_args.add_argument("--training-dir", "-t", required=True, help="Path to the directory containing the training data.", dest="training_dir_path")
     parser_train_required_args.add_argument("--testing-dir", "-e", required=True, help="Path to the directory containing the testing data.", dest="testing_dir_path")
-    parser_train_required_args.add_argument("--num-features", "-f", choices=["6", "36", "4032"], required=True, help="Path to the directory containing the testing data.", dest="num_features")
+    parser_train_required_args.add_argument("--num-features", "-f", choices=NUM_FEATURES_CHOICES, required=True, help="Path to the directory containing the testing data.", dest="num_features")
     parser_train_required_args.add_argument("--out-model", "-m", required=True, help="Name of the file in which to save the model.", dest="output_model_path")
-    parser_train_required_args.add_argument("--model-type", choices=["cnn", "mlp", "et"], required=True, help="The type of the model to train.", dest="model_type")
+    parser_train_required_args.add_argument("--model-type", choices=MODEL_TYPE_CHOICES, required=True, help="The type of the model to train.", dest="model_type")
     parser_train_optional_args.add_argument("--epochs", required=False, type=int, default="5", help="How many training epochs to go through.", dest="training_epochs")
     parser_train_optional_args.add_argument("--batchSize", required=False, type=int, default="16", help="Size of the training batch.", dest="training_batch_size")
     parser_train_optional_args.add_argument("--testing-batchSize", required=False, type=int, default="16", help="Size of the evaluation batch.", dest="evaluation_batch_size")
+    parser_train_optional_args.add_argument("--dtype", required=False, choices=DTYPE_CHOICES, default=None, help="Precision of the feature arrays (default: fp16 for cnn, fp32 otherwise).", dest="feature_dtype")
 
     # Create evaluation subprogram parser
     parser_test = subparsers.add_parser("test", help="Load a model for testing.")
@@ -55,10 +145,12 @@ def parse_arguments():
     parser_test_required_args = parser_test.add_argument_group("Required arguments")
     parser_test_optional_args = parser_test.add_argument_group("Optional arguments")
     parser_test_required_args.add_argument("--testing-dir", "-e", required=True, help="Path to the directory containing the testing data.", dest="testing_dir_path")
-    parser_test_required_args.add_argument("--num-features", "-f", choices=["6", "36", "4032"], required=True, help="Path to the directory containing the testing data.", dest="num_features")
+    parser_test_required_args.add_argument("--num-features", "-f", choices=NUM_FEATURES_CHOICES, required=True, help="Path to the directory containing the testing data.", dest="num_features")
     parser_test_required_args.add_argument("--model", "-m", required=True, help="The name of the file from which to load the model.", dest="model_path")
-    parser_test_required_args.add_argument("--model-type", choices=["cnn", "mlp", "et"], required=True, help="The type of the model to load.", dest="model_type")
+    parser_test_required_args.add_argument("--model-type", choices=MODEL_TYPE_CHOICES, required=True, help="The type of the model to load.", dest="model_type")
     parser_test_optional_args.add_argument("--batchSize", required=False, type=int, default="16", help="Size of the evaluation batch.", dest="evaluation_batch_size")
+    parser_test_optional_args.add_argument("--auto-batch", required=False, action="store_true", help="Auto-tune the evaluation batch size from measured throughput.", dest="auto_batch")
+    parser_test_optional_args.add_argument("--dtype", required=False, choices=DTYPE_CHOICES, default=None, help="Precision of the feature arrays (default: fp16 for cnn, fp32 otherwise).", dest="feature_dtype")
 
 
     # Create prediction subprogram parser
@@ -68,14 +160,98 @@ def parse_arguments():
     parser_predict_optional_args = parser_predict.add_argument_group("Optional arguments")
     parser_predict_required_args.add_argument("--prediction-dir", "-p", required=True, help="Path to the directory containing the prediction data.", dest="prediction_dir_path")
     parser_predict_required_args.add_argument("--prediction-output-file", "-o", required=True, help="File in which to save the predictions.", dest="prediction_output_file")
+    parser_predict_required_args.add_argument("--num-features", "-f", choices=NUM_FEATURES_CHOICES, required=True, help="Number of features per row in the prediction data.", dest="num_features")
     parser_predict_required_args.add_argument("--model", "-m", required=True, help="The name of the file from which to load the model.", dest="model_path")
-    parser_predict_required_args.add_argument("--model-type", choices=["cnn", "mlp", "et"], required=True, help="The type of the model to load.", dest="model_type")
+    parser_predict_required_args.add_argument("--model-type", choices=MODEL_TYPE_CHOICES, required=True, help="The type of the model to load.", dest="model_type")
     parser_predict_optional_args.add_argument("--batchSize", required=False, type=int, default="32", help="Size of the prediction batch.", dest="prediction_batch_size")
+    parser_predict_optional_args.add_argument("--auto-batch", required=False, action="store_true", help="Auto-tune the prediction batch size from measured throughput.", dest="auto_batch")
+    parser_predict_optional_args.add_argument("--batch-delay-ms", required=False, type=float, default=2, help="How long to wait for more rows before predicting a partial batch.", dest="batch_delay_ms")
 
     return parser.parse_args()
 
 def enumerate_data_files_in_dir(dir_path):
-    return glob.glob(f'{dir_path}/*.txt')
+    # os.scandir streams directory entries without an extra stat per file,
+    # which matters for directories holding tens of thousands of SVM shards
+    with os.scandir(dir_path) as entries:
+        return [entry.path for entry in entries if entry.name.endswith(".txt") and entry.is_file(follow_symlinks=False)]
+
+def is_sparse_input(args):
+    # The full-width 4032-feature input is almost entirely zeros, keep it in CSR
+    return int(args.num_features) == 4032
+
+def load_training_data(args) -> dict:
+    """
+    Reads and concatenates the SVM files in the training directory.
+
+    Args:
+        args: The object that contains all the parsed CLI arguments.
+
+    Returns:
+        A dictionary with the training data, labels, and training parameters.
+    """
+
+    sparse = is_sparse_input(args)
+    training_dir_filenames = enumerate_data_files_in_dir(args.training_dir_path)
+
+    X_train, y_train = read_concat_svm_files_cached(training_dir_filenames, int(args.num_features), sparse=sparse)
+
+    # scipy.sparse has no float16, so CSR input stays float32 here and half
+    # precision is applied per batch after densification (SparseBatchSequence)
+    feature_dtype = resolve_feature_dtype(args)
+    if not sparse:
+        X_train = X_train.astype(feature_dtype, copy=False)
+
+    if args.model_type == "et" and not sparse:
+        # Back the training rows with shared memory so the parallel tree
+        # builders share pages instead of each pickling a full copy
+        X_train = as_shared_memmap(X_train)
+
+    return {"data": X_train, "labels": y_train, "dtype": feature_dtype, "epochs": args.training_epochs,"batch_size": args.training_batch_size}
+
+def load_testing_data(args) -> dict:
+    """
+    Reads and concatenates the SVM files in the testing directory,
+    segmenting the data in the same pass.
+
+    Args:
+        args: The object that contains all the parsed CLI arguments.
+
+    Returns:
+        A dictionary with the testing and segmented testing data and the
+        total number of test samples.
+    """
+
+    sparse = is_sparse_input(args)
+    testing_dir_filenames = enumerate_data_files_in_dir(args.testing_dir_path)
+
+    X_test, y_test, X_test_segmented, y_test_segmented = read_concat_svm_files_cached(testing_dir_filenames, int(args.num_features), sparse=sparse, segment=True)
+
+    # scipy.sparse has no float16, so CSR input stays float32 here and half
+    # precision is applied per batch after densification (SparseBatchSequence)
+    feature_dtype = resolve_feature_dtype(args)
+    if not sparse:
+        X_test = X_test.astype(feature_dtype, copy=False)
+
+    return {
+        "testing": {"data": X_test, "labels": y_test, "dtype": feature_dtype, "batch_size": args.evaluation_batch_size},
+        "testing_segmented": {"data": X_test_segmented, "labels": y_test_segmented},
+        "total_test_samples": len(y_test_segmented)
+    }
+
+def count_total_test_samples(args):
+    """
+    Counts the test samples across the testing directory without parsing
+    any of the data, for callers that only need the count (e.g. progress
+    reporting).
+
+    Args:
+        args: The object that contains all the parsed CLI arguments.
+
+    Returns:
+        The total number of test samples.
+    """
+
+    return sum(count_svm_samples(filename) for filename in enumerate_data_files_in_dir(args.testing_dir_path))
 
 def read_input_data(input_type, args) -> dict:
     """
@@ -91,45 +267,68 @@ def read_input_data(input_type, args) -> dict:
     """
 
     if input_type == "train":
-        # Read training and testing data
-        training_dir_filenames = enumerate_data_files_in_dir(args.training_dir_path)
-        testing_dir_filenames = enumerate_data_files_in_dir(args.testing_dir_path)
-
-        X_train, y_train = read_concat_svm_files(training_dir_filenames, int(args.num_features))
-        X_test, y_test = read_concat_svm_files(testing_dir_filenames, int(args.num_features))
-
-        X_test_segmented, y_test_segmented = segment_svm_data(X_test, y_test)
-        total_test_samples = len(y_test_segmented)
-        
-        return {
-            "training": {"data": X_train, "labels": y_train, "epochs": args.training_epochs,"batch_size": args.training_batch_size}, 
-            "testing": {"data": X_test, "labels": y_test,"batch_size": args.evaluation_batch_size},
-            "testing_segmented": {"data": X_test_segmented, "labels": y_test_segmented},
-            "total_test_samples": total_test_samples
-        }
+        input_dict = {"training": load_training_data(args)}
+        input_dict.update(load_testing_data(args))
+        return input_dict
 
     elif input_type == "test":
-        # Read testing data
-        testing_dir_filenames = enumerate_data_files_in_dir(args.testing_dir_path)
+        return load_testing_data(args)
 
-        X_test, y_test = read_concat_svm_files(testing_dir_filenames, int(args.num_features))
+    else:
+        print(c("Error: Wrong input type.", "red"))
+        quit()
 
-        X_test_segmented, y_test_segmented = segment_svm_data(X_test, y_test)
+# Batch sizes sampled when fitting the R(x) = ax + b throughput model
+AUTO_BATCH_CANDIDATES = [32, 128, 512]
 
-        total_test_samples = len(y_test_segmented)
+def fit_best_batch_size(model, rows):
+    """
+    Measures prediction throughput on the passed rows at three
+    candidate batch sizes, fits the linear R(x) = ax + b throughput
+    model, and returns the candidate the fit favours.
 
-        return {
-            "testing": {"data": X_test, "labels": y_test, "batch_size": args.evaluation_batch_size},
-            "testing_segmented": {"data": X_test_segmented, "labels": y_test_segmented},
-            "total_test_samples": total_test_samples
-        }
-    
-    #elif input_type == "predict":
-    #    return {"prediction": {"data": prediction_data}}
+    Args:
+        model: The loaded model to measure
+        rows: The feature rows to measure with
 
-    else:
-        print(colored("Error: Wrong input type.", "red"))
-        quit()
+    Returns:
+        The best candidate batch size
+    """
+
+    rates = [model.measure_prediction_rate(rows, candidate) for candidate in AUTO_BATCH_CANDIDATES]
+
+    a, b = np.polyfit(AUTO_BATCH_CANDIDATES, rates, 1)
+    predicted_rates = [a * candidate + b for candidate in AUTO_BATCH_CANDIDATES]
+
+    return AUTO_BATCH_CANDIDATES[int(np.argmax(predicted_rates))]
+
+def tune_evaluation_batch_size(model, input_dict):
+    """
+    Auto-tunes the evaluation batch size by measuring prediction
+    throughput on the testing data, keeping the candidate the
+    R(x) = ax + b fit favours. The chosen size is written back into
+    the testing section of the input dictionary.
+
+    Args:
+        model: The loaded model to measure
+        input_dict: The input data dictionary produced by read_input_data
+
+    Returns:
+        The chosen evaluation batch size
+    """
+
+    testing_dict = input_dict["testing"]
+    X_test = testing_dict["data"]
+
+    best_batch_size = fit_best_batch_size(model, X_test)
+
+    testing_dict["batch_size"] = best_batch_size
+
+    # Keras sequences carry their own batch size, keep it in sync
+    if hasattr(X_test, "batch_size"):
+        X_test.batch_size = best_batch_size
+
+    return best_batch_size
 
 def print_training_report(training_dict):
     training_time = training_dict["training_time"]
@@ -137,8 +336,8 @@ def print_training_report(training_dict):
 
     print("\nTraining Report")
     print("================================")
-    print(colored(f'Training accuracy: {training_accuracy}', "blue"))
-    print(colored(f'Training time: {training_time}s', "blue"))
+    print(c(f'Training accuracy: {training_accuracy}', "blue"))
+    print(c(f'Training time: {training_time}s', "blue"))
 
 def print_testing_report(testing_dict):
     testing_accuracy = testing_dict["accuracy_testing"]
@@ -152,15 +351,15 @@ def print_testing_report(testing_dict):
 
     print("\nTesting Report")
     print("================================")
-    print(colored(f'Testing accuracy: {testing_accuracy}', "blue"))
-    print(colored(f'Testing prediction time: {testing_prediction_time}s', "blue"))
+    print(c(f'Testing accuracy: {testing_accuracy}', "blue"))
+    print(c(f'Testing prediction time: {testing_prediction_time}s', "blue"))
     print("\nConfusion Matrix:")
     print(conf_matrix)
     print()
-    print(colored(f'Accuracy A1: {accuracy_A1}', "yellow"))
-    print(colored(f'Accuracy Ac: {accuracy_Ac}', "yellow"))
-    print(colored(f'Accuracy Ah: {accuracy_Ah}', "yellow"))
-    print(colored(f'Accuracy Af: {accuracy_Af}', "yellow"))
+    print(c(f'Accuracy A1: {accuracy_A1}', "yellow"))
+    print(c(f'Accuracy Ac: {accuracy_Ac}', "yellow"))
+    print(c(f'Accuracy Ah: {accuracy_Ah}', "yellow"))
+    print(c(f'Accuracy Af: {accuracy_Af}', "yellow"))
 
 def train_model(args):
     """
@@ -170,17 +369,10 @@ def train_model(args):
         args: The object that contains all the parsed CLI arguments. 
     """
 
-    print(colored("\nReading input data...", "green"))
+    print(c("\nReading input data...", "green"))
     input_dict = read_input_data("train", args)
 
-    model = None
-
-    if args.model_type == "et":
-        model = ExtraTreesModel()
-    elif (args.model_type == "mlp"):
-        model = MlpModel()
-    elif (args.model_type == "cnn"):
-        model = CnnModel(in_dict = input_dict)
+    model = build_model(args, input_dict)
 
     model.build_new_model()
     training_dict = model.train(input_dict)
@@ -200,37 +392,114 @@ def test_model(args):
         args: The object that contains all the parsed CLI arguments. 
     """
 
-    print(colored("\nReading input data...", "green"))
+    print(c("\nReading input data...", "green"))
     input_dict = read_input_data("test", args)
 
-    model = None
+    model = load_cached_model(args.model_path, args.model_type)
 
-    if (args.model_type == "et"):
-        model = ExtraTreesModel()
-    elif (args.model_type == "mlp"):
-        model = MlpModel()
-    elif (args.model_type == "cnn"):
-        model = CnnModel(in_dict = input_dict)
-    
-    model.load_model(args.model_path)
+    # No-op for the scikit-learn models; reshapes/encodes the input for the CNN
+    model.preprocess_input(input_dict)
+
+    if args.auto_batch:
+        tuned_batch_size = tune_evaluation_batch_size(model, input_dict)
+        print(c(f'Auto-tuned evaluation batch size: {tuned_batch_size}', "green"))
 
     testing_dict = model.test(input_dict)
 
     print_testing_report(testing_dict)
 
-# TODO implement
 def predict(args):
-    if (args.model_type == "et"):
-        model = ExtraTreesModel()
-    elif (args.model_type == "mlp"):
-        model = MlpModel()
-    elif (args.model_type == "cnn"):
-        model = CnnModel()
+    """
+    Loads a model and predicts the labels of the data in the prediction
+    directory, streaming the files through a small queue. A reader
+    thread parses one file at a time while the consumer accumulates
+    rows into micro-batches, waiting up to --batch-delay-ms for more
+    rows before predicting a partial batch, so the model sees large
+    batches without stalling the stream.
 
-    model.load_model(args.model_path)
+    Args:
+        args: The object that contains all the parsed CLI arguments.
+    """
 
-    # TODO continue implementation
-    raise NotImplementedError
+    model = load_cached_model(args.model_path, args.model_type)
+
+    prediction_dir_filenames = enumerate_data_files_in_dir(args.prediction_dir_path)
+    num_features = int(args.num_features)
+    batch_delay_s = args.batch_delay_ms / 1000
+
+    if args.auto_batch and prediction_dir_filenames:
+        # Tune on the rows of the first file before the consume loop starts
+        sample_rows, sample_labels = read_svm_file(prediction_dir_filenames[0], num_features)
+        args.prediction_batch_size = fit_best_batch_size(model, np.asarray(sample_rows, dtype=np.float32))
+        print(c(f'Auto-tuned prediction batch size: {args.prediction_batch_size}', "green"))
+
+    # A few batches of headroom: bounds the reader's memory use so it cannot
+    # parse the whole directory ahead of the consumer
+    rows_queue = queue.Queue(maxsize=4)
+    reader_errors = []
+
+    def read_prediction_files():
+        try:
+            for filename in prediction_dir_filenames:
+                rows, labels = read_svm_file(filename, num_features)
+                rows_queue.put(np.asarray(rows, dtype=np.float32))
+        except Exception as error:
+            reader_errors.append(error)
+        finally:
+            # Always signal the end of the stream so the consumer cannot hang
+            rows_queue.put(None)
+
+    reader_thread = threading.Thread(target=read_prediction_files, daemon=True)
+    reader_thread.start()
+
+    predictions = []
+    batch = []
+    batch_rows = 0
+
+    while True:
+        if not batch:
+            item = rows_queue.get()
+        else:
+            try:
+                item = rows_queue.get(timeout=batch_delay_s)
+            except queue.Empty:
+                # No more rows arrived in time, predict the partial batch
+                predictions.append(model.predict(np.concatenate(batch)))
+                batch = []
+                batch_rows = 0
+                continue
+
+        if item is None:
+            if batch:
+                predictions.append(model.predict(np.concatenate(batch)))
+            break
+
+        batch.append(item)
+        batch_rows += item.shape[0]
+
+        if batch_rows >= args.prediction_batch_size:
+            predictions.append(model.predict(np.concatenate(batch)))
+            batch = []
+            batch_rows = 0
+
+    reader_thread.join()
+
+    # Surface a reader failure in the main thread instead of silently
+    # writing predictions for a truncated stream
+    if reader_errors:
+        raise reader_errors[0]
+
+    all_predictions = np.concatenate(predictions) if predictions else np.empty(0)
+    np.savetxt(args.prediction_output_file, all_predictions, fmt="%d")
+
+    print(c(f'Saved {all_predictions.shape[0]} predictions in {args.prediction_output_file}', "green"))
+
+# Maps each subprogram to its entry function
+SUBROUTINES = {
+    "train": train_model,
+    "test": test_model,
+    "predict": predict
+}
 
 def get_subroutine(args):
     """
@@ -243,17 +512,13 @@ def get_subroutine(args):
         The functions corresponding the the CLI subprogram utilized.
     """
 
-    if args.subprogram == "train":
-        print(colored("Executing training subprogram.", "green"))
-        return train_model
-    elif args.subprogram == "test":
-        print(colored("Executing testing subprogram.", "green"))
-        return test_model
-    elif args.subprogram == "predict":
-        print(colored("Executing prediction subprogram.", "green"))
-        return predict
-    else:
-        print(colored("Fatal Error: Wrong subprogram specified.", "red"))
+    subroutine = SUBROUTINES.get(args.subprogram)
+
+    if subroutine is None:
+        print(c("Fatal Error: Wrong subprogram specified.", "red"))
         quit()
 
+    print(c(f'Executing {args.subprogram} subprogram.', "green"))
+    return subroutine
+
 if __name__ == "__main__": main()
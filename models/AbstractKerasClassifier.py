@@ -1,15 +1,23 @@
+import os
 from timeit import default_timer as timer
 from sklearn.metrics import confusion_matrix
-from termcolor import colored
+from utils.term_utils import c
 import pickle
 
 
 from keras.models import load_model
 from keras.models import save_model
 
+from keras.utils import Sequence
+
 from models.AbstractModel import AbstractModel
 from utils.accuracy_utils import *
 
+# Background workers that prefetch and assemble batches while the network
+# computes, and the number of batches they may queue ahead
+GENERATOR_WORKERS = min(8, os.cpu_count())
+GENERATOR_MAX_QUEUE_SIZE = 4 * GENERATOR_WORKERS
+
 class AbstractKerasClassifier(AbstractModel):
 
     def __init__(self, **kwargs):
@@ -17,11 +25,11 @@ class AbstractKerasClassifier(AbstractModel):
         self.model = None
 
     def load_model(self, path):
-        print(colored(f'\nLoading keras model from {path}\n', "green"))
+        print(c(f'\nLoading keras model from {path}\n', "green"))
         self.model = self.model = load_model(path)
 
     def save_model(self, path):
-        print(colored(f'\nSaving keras model in {path}.p', "green"))
+        print(c(f'\nSaving keras model in {path}.p', "green"))
         self.model.save(path)
 
     def preprocess_input(self, input_dict):
@@ -46,6 +54,42 @@ class AbstractKerasClassifier(AbstractModel):
             "accuracy_Af": accuracy_Af
         }
 
+    def measure_prediction_rate(self, rows, batch_size, max_rows=4096):
+        """
+        Times a prediction pass over a bounded sample of the passed rows
+        at the given batch size and returns the measured rows per second.
+
+        Args:
+            rows: The feature rows, as a numpy array or a keras Sequence
+            batch_size (int): The batch size to measure with
+            max_rows (int): Upper bound on the number of rows to time
+
+        Returns:
+            Measured prediction throughput in rows per second
+        """
+
+        if isinstance(rows, Sequence):
+            original_batch_size = rows.batch_size
+            rows.batch_size = batch_size
+            steps = min(len(rows), max(1, max_rows // batch_size))
+
+            start = timer()
+            self.model.predict_generator(rows, steps=steps)
+            end = timer()
+
+            rows.batch_size = original_batch_size
+            num_rows = steps * batch_size
+        else:
+            sample = rows[:max_rows]
+
+            start = timer()
+            self.model.predict(sample, batch_size=batch_size)
+            end = timer()
+
+            num_rows = len(sample)
+
+        return num_rows / (end - start)
+
     def train(self, input_dict) -> dict:
         X_train = input_dict["training"]["data"]
         y_train = input_dict["training"]["labels"]
@@ -53,11 +97,18 @@ class AbstractKerasClassifier(AbstractModel):
         batch_size = input_dict["training"]["batch_size"]
 
         start = timer()
-        self.model.fit(X_train, y_train,epochs=epochs,batch_size=batch_size)
+        if isinstance(X_train, Sequence):
+            # Batches are served (and densified) one at a time by the sequence
+            self.model.fit_generator(X_train, epochs=epochs, workers=GENERATOR_WORKERS, use_multiprocessing=True, max_queue_size=GENERATOR_MAX_QUEUE_SIZE)
+        else:
+            self.model.fit(X_train, y_train,epochs=epochs,batch_size=batch_size)
         end = timer()
         training_time = end - start
 
-        accuracy_training = self.model.evaluate(X_train, y_train,batch_size=batch_size)[1]
+        if isinstance(X_train, Sequence):
+            accuracy_training = self.model.evaluate_generator(X_train, workers=GENERATOR_WORKERS, use_multiprocessing=True, max_queue_size=GENERATOR_MAX_QUEUE_SIZE)[1]
+        else:
+            accuracy_training = self.model.evaluate(X_train, y_train,batch_size=batch_size)[1]
         return {
             "training_time": training_time,
             "accuracy_training": accuracy_training
@@ -70,10 +121,16 @@ class AbstractKerasClassifier(AbstractModel):
         batch_size = input_dict["testing"]["batch_size"]
 
 
-        accuracy_testing = self.model.evaluate(X_test, y_test, batch_size=batch_size)[1]
-        start = timer()
-        y_pred_proba = self.model.predict(X_test)
-        end = timer()
+        if isinstance(X_test, Sequence):
+            accuracy_testing = self.model.evaluate_generator(X_test, workers=GENERATOR_WORKERS, use_multiprocessing=True, max_queue_size=GENERATOR_MAX_QUEUE_SIZE)[1]
+            start = timer()
+            y_pred_proba = self.model.predict_generator(X_test, workers=GENERATOR_WORKERS, use_multiprocessing=True, max_queue_size=GENERATOR_MAX_QUEUE_SIZE)
+            end = timer()
+        else:
+            accuracy_testing = self.model.evaluate(X_test, y_test, batch_size=batch_size)[1]
+            start = timer()
+            y_pred_proba = self.model.predict(X_test)
+            end = timer()
         testing_prediction_time = end - start
 
         y_pred =  np.argmax(y_pred_proba,1)
@@ -102,6 +159,15 @@ class AbstractKerasClassifier(AbstractModel):
 
         return output_dict
 
-    # TODO implement
-    def predict(self):
-        None
+    def predict(self, rows):
+        """
+        Predicts the labels of the passed rows with the loaded model.
+
+        Args:
+            rows: The feature rows, as a numpy array
+
+        Returns:
+            The predicted labels as a numpy array
+        """
+
+        return np.argmax(self.model.predict(rows), 1)
@@ -34,7 +34,6 @@ class AbstractModel(ABC):
     def test(self, input_dict) -> dict:
         raise NotImplementedError
 
-    # TODO finalize prototype
     @abstractmethod
-    def predict(self):
+    def predict(self, rows):
         raise NotImplementedError
\ No newline at end of file
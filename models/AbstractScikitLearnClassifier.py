@@ -1,6 +1,6 @@
 from timeit import default_timer as timer
 from sklearn.metrics import confusion_matrix
-from termcolor import colored
+from utils.term_utils import c
 import pickle
 
 from models.AbstractModel import AbstractModel
@@ -13,11 +13,11 @@ class AbstractScikitLearnClassifier(AbstractModel):
         self.model = None
 
     def load_model(self, path):
-        print(colored(f'\nLoading scikit-learn model from {path}\n', "green"))
+        print(c(f'\nLoading scikit-learn model from {path}\n', "green"))
         self.model = pickle.load(open(f'{path}', "rb"))
 
     def save_model(self, path):
-        print(colored(f'\nSaving scikit-learn model in {path}.p', "green"))
+        print(c(f'\nSaving scikit-learn model in {path}.p', "green"))
         pickle.dump(self.model, open(f'{path}.p', "wb"))
 
     def preprocess_input(self, input_dict):
@@ -42,6 +42,30 @@ class AbstractScikitLearnClassifier(AbstractModel):
             "accuracy_Af": accuracy_Af
         }
 
+    def measure_prediction_rate(self, rows, batch_size, max_rows=4096):
+        """
+        Times a prediction pass over a bounded sample of the passed rows
+        and returns the measured rows per second. scikit-learn models
+        predict whole arrays at once, so batch_size is accepted for
+        interface parity but does not affect the measurement.
+
+        Args:
+            rows: The feature rows, as a numpy array or a CSR matrix
+            batch_size (int): Ignored, kept for interface parity
+            max_rows (int): Upper bound on the number of rows to time
+
+        Returns:
+            Measured prediction throughput in rows per second
+        """
+
+        sample = rows[:max_rows]
+
+        start = timer()
+        self.model.predict(sample)
+        end = timer()
+
+        return sample.shape[0] / (end - start)
+
     def train(self, input_dict) -> dict:
         X_train = input_dict["training"]["data"]
         y_train = input_dict["training"]["labels"]
@@ -95,6 +119,15 @@ class AbstractScikitLearnClassifier(AbstractModel):
 
         return output_dict
 
-    # TODO implement
-    def predict(self):
-        None
\ No newline at end of file
+    def predict(self, rows):
+        """
+        Predicts the labels of the passed rows with the loaded model.
+
+        Args:
+            rows: The feature rows, as a numpy array or a CSR matrix
+
+        Returns:
+            The predicted labels as a numpy array
+        """
+
+        return self.model.predict(rows)
\ No newline at end of file
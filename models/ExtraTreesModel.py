@@ -1,6 +1,6 @@
 from sklearn.ensemble import ExtraTreesClassifier
 from models.AbstractScikitLearnClassifier import AbstractScikitLearnClassifier
-from termcolor import colored
+from utils.term_utils import c
 
 class ExtraTreesModel(AbstractScikitLearnClassifier):
 
@@ -13,9 +13,9 @@ class ExtraTreesModel(AbstractScikitLearnClassifier):
                                    n_jobs=-1, verbose=1, random_state=3333)
 
     def train(self, input_dict) -> dict:
-        print(colored("Training ExtraTrees model...", "green"))
+        print(c("Training ExtraTrees model...", "green"))
         return super().train(input_dict)
 
     def test(self, input_dict) -> dict:
-        print(colored("Testing ExtraTrees model...", "green"))
+        print(c("Testing ExtraTrees model...", "green"))
         return super().test(input_dict)
\ No newline at end of file
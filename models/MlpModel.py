@@ -1,5 +1,5 @@
 from sklearn.neural_network import MLPClassifier
-from termcolor import colored
+from utils.term_utils import c
 from models.AbstractScikitLearnClassifier import AbstractScikitLearnClassifier
 
 class MlpModel(AbstractScikitLearnClassifier):
@@ -12,9 +12,9 @@ class MlpModel(AbstractScikitLearnClassifier):
         self.model = MLPClassifier((64, 64, 64), solver="adam", batch_size=32, learning_rate="adaptive", max_iter=40, verbose=True)
 
     def train(self, input_dict) -> dict:
-        print(colored("Training MLP model...", "green"))
+        print(c("Training MLP model...", "green"))
         return super().train(input_dict)
 
     def test(self, input_dict) -> dict:
-        print(colored("Testing MLP model...", "green"))
+        print(c("Testing MLP model...", "green"))
         return super().test(input_dict)
\ No newline at end of file
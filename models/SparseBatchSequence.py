@@ -0,0 +1,47 @@
+import numpy as np
+import scipy.sparse
+from keras.utils import Sequence
+
+class SparseBatchSequence(Sequence):
+    """
+    Keras Sequence that serves batches out of a CSR feature matrix,
+    densifying one batch at a time right before it is handed to the
+    network. This keeps the dense working set at batch_size rows
+    instead of recreating the full dense matrix up front.
+
+    Args:
+        rows: The feature rows, as a CSR matrix or a numpy array
+        labels: The labels matching the rows, or None for prediction
+        batch_size (int): Number of rows per served batch
+        reshape (tuple): Optional per-row shape to apply to each batch
+        dtype: Optional dtype to cast each densified batch to; scipy.sparse
+            has no float16, so half precision can only be applied here
+    """
+
+    def __init__(self, rows, labels, batch_size, reshape=None, dtype=None):
+        self.rows = rows
+        self.labels = labels
+        self.batch_size = batch_size
+        self.reshape = reshape
+        self.dtype = dtype
+
+    def __len__(self):
+        return int(np.ceil(self.rows.shape[0] / self.batch_size))
+
+    def __getitem__(self, index):
+        batch_slice = slice(index * self.batch_size, (index + 1) * self.batch_size)
+
+        batch_rows = self.rows[batch_slice]
+        if scipy.sparse.issparse(batch_rows):
+            batch_rows = batch_rows.toarray()
+
+        if self.dtype is not None:
+            batch_rows = batch_rows.astype(self.dtype, copy=False)
+
+        if self.reshape is not None:
+            batch_rows = batch_rows.reshape((-1,) + self.reshape)
+
+        if self.labels is None:
+            return batch_rows
+
+        return batch_rows, self.labels[batch_slice]
@@ -6,6 +6,22 @@
 
 import numpy as np
 
+def get_segment_starts(segmented_test_labels):
+    """
+    Computes the flat-array start index of every segment in the passed
+    segmented labels.
+
+    Args:
+        segmented_test_labels: Segmented array of the test labels
+
+    Returns:
+        numpy array of the start index of each segment
+    """
+
+    segment_sizes = np.fromiter((segment.size for segment in segmented_test_labels), dtype=np.int64)
+
+    return np.concatenate(([0], np.cumsum(segment_sizes)[:-1]))
+
 def get_accuracy_A1(confusion_matrix, total_samples):
     """
     Computes the A1 accuracy given the confusion matrix and the total number
@@ -41,28 +57,16 @@ def get_accuracy_Ac(confusion_matrix, predictions, segmented_test_labels):
         The Ac accuracy
     """
 
-    predicted_samples_with_errors = 0
-
-    iter_index = 0
-
-    for sample in segmented_test_labels:
-        first_label_index = iter_index
-        found_invalid = False
-
-        if predictions[first_label_index] != 1:
-            iter_index += sample.size
-            continue
-
-        for label in np.nditer(sample):
-            if iter_index == first_label_index:
-                iter_index += 1
-                continue
+    predictions = np.asarray(predictions)
+    segment_starts = get_segment_starts(segmented_test_labels)
 
-            if not found_invalid and predictions[iter_index] == 1:
-                predicted_samples_with_errors += 1
-                found_invalid = True
+    # Per segment: number of rows predicted as 1, including the first row
+    predicted_ones_per_segment = np.add.reduceat((predictions == 1).astype(np.int64), segment_starts)
+    first_row_predicted_one = predictions[segment_starts] == 1
 
-            iter_index += 1
+    # A segment counts as erroneous when its first row and at least one
+    # other row are both predicted as 1
+    predicted_samples_with_errors = np.count_nonzero(first_row_predicted_one & (predicted_ones_per_segment > 1))
 
     return predicted_samples_with_errors / confusion_matrix[1,1]
 
@@ -104,25 +108,13 @@ def get_accuracy_Ah(predicted_probabilities, segmented_test_labels):
         The Ah accuracy
     """
 
-    correct_predictions = 0
-
-    max_index = 0
-    iter_index = 0
-
-    for sample in segmented_test_labels:
-        first_label_index = iter_index
-        max_index = first_label_index
-
-        for label in np.nditer(sample):
-            if predicted_probabilities[iter_index][1] > predicted_probabilities[max_index][1]:
-                max_index = iter_index
-
-            iter_index += 1
+    probabilities_of_one = np.asarray(predicted_probabilities)[:, 1]
+    segment_starts = get_segment_starts(segmented_test_labels)
 
-        # If the highest probability of 1 has the index of the first label
-        # in the sample, then it is correct
-        if max_index == first_label_index:
-            correct_predictions += 1
+    # If the highest probability of 1 in a segment is attained by its first
+    # row, then it is correct; ties go to the first row, as before
+    max_per_segment = np.maximum.reduceat(probabilities_of_one, segment_starts)
+    correct_predictions = np.count_nonzero(probabilities_of_one[segment_starts] == max_per_segment)
 
     total_samples = len(segmented_test_labels)
 
@@ -3,9 +3,17 @@
 # for the purpose of this project.
 #############################################################################
 
+import os
+import atexit
+import hashlib
+import mmap
+import tempfile
 import numpy as np
 import pandas as pd
-from sklearn.datasets import load_svmlight_file
+import scipy.sparse
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.datasets import load_svmlight_file, load_svmlight_files
+from utils.svm_utils_njit import NUMBA_AVAILABLE, read_svm_file_njit
 import math
 
 def read_svm_file(filename, num_features):
@@ -25,31 +33,263 @@ def read_svm_file(filename, num_features):
     
     return data0Dense, data[1]
 
-def read_concat_svm_files(filenames, num_features):
+def _read_svm_file_worker(filename, num_features):
+    """
+    Worker function for the parallel reads in read_concat_svm_files.
+    Parses a single SVM file through the scikit-learn C parser and
+    returns the rows densified as float32 along with the labels.
+
+    Args:
+        filename (string): The path of the SVM file
+        num_features (int): The number of features per row
+
+    Returns:
+        dense float32 rows, labels ; as numpy arrays
+    """
+
+    if NUMBA_AVAILABLE:
+        # JIT-compiled tokenizer writing straight into a dense array
+        return read_svm_file_njit(filename, num_features)
+
+    # zero_based=False matches the 1-based contract the njit parser enforces,
+    # so results do not depend on whether numba happens to be installed
+    rows, labels = load_svmlight_file(filename, n_features=num_features, dtype=np.float32, zero_based=False)
+
+    return rows.toarray(), labels
+
+def count_svm_rows(filename):
+    """
+    Counts the number of data rows in the SVM file with the passed name
+    by counting line endings, without parsing any of the values.
+
+    Args:
+        filename (string): The path of the SVM file
+
+    Returns:
+        Number of rows in the file
+    """
+
+    with open(filename, "rb") as svm_file:
+        data = svm_file.read()
+
+    num_rows = data.count(b"\n")
+
+    # Account for a last row without a trailing newline
+    if data and not data.endswith(b"\n"):
+        num_rows += 1
+
+    return num_rows
+
+def read_concat_svm_files(filenames, num_features, sparse=False, segment=False):
     """
     Reads the SVM files identified by the names in the list
     of filenames passed and return a concatenated version.
-    
+
+    When segment is True the data is additionally segmented right after
+    the parse, while it is still hot in cache, and the segmented views
+    are returned alongside the concatenated arrays.
+
+    When sparse is True the rows are kept in scipy CSR format instead
+    of being densified, so only the non-zero entries are stored and
+    processed. This is the intended mode for the 4032-feature input,
+    which is almost entirely zeros row by row.
+
+    In dense mode, a first pass counts the rows per file so the
+    concatenated arrays can be allocated once up front; each parsed
+    file is then copied directly into its slice of the output, avoiding
+    the O(N^2) bytes copied by growing a list of intermediate arrays.
+    File parsing is embarrassingly parallel, so the files are spread
+    over one parser process per CPU core. Rows are stored as float32
+    to halve the memory traffic downstream.
+
     Args:
         filenames (list(string)): Filenames of the SVM files to read and concatenate
-    
+        num_features (int): The number of features per row
+        sparse (bool): Whether to keep the rows in CSR format
+
+    Returns:
+        concatenated rows, concatenated labels ; the labels as a numpy
+        array, the rows as a numpy array or a CSR matrix when sparse
+    """
+
+    if sparse:
+        parts = load_svmlight_files(filenames, n_features=num_features, dtype=np.float32)
+
+        # load_svmlight_files returns a flat [X_0, y_0, X_1, y_1, ...] list
+        concat_rows = scipy.sparse.vstack(parts[0::2], format="csr")
+        concat_labels = np.concatenate(parts[1::2]).astype(np.int32)
+
+        return _with_segments(concat_rows, concat_labels, segment)
+
+    total_rows = sum(count_svm_rows(filename) for filename in filenames)
+
+    concat_rows_np = np.empty((total_rows, num_features), dtype=np.float32)
+    concat_labels_np = np.empty(total_rows, dtype=np.int32)
+
+    if len(filenames) > 1:
+        max_workers = min(os.cpu_count(), len(filenames))
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = executor.map(_read_svm_file_worker, filenames, [num_features] * len(filenames))
+            offset = _fill_preallocated(results, concat_rows_np, concat_labels_np)
+    else:
+        results = (_read_svm_file_worker(filename, num_features) for filename in filenames)
+        offset = _fill_preallocated(results, concat_rows_np, concat_labels_np)
+
+    # The line count is an upper bound (e.g. blank lines), trim to the rows parsed
+    return _with_segments(concat_rows_np[:offset], concat_labels_np[:offset], segment)
+
+def _with_segments(rows, labels, segment):
+    """
+    Returns (rows, labels), extended with their segmented views when
+    segment is True.
+
+    Args:
+        rows: The concatenated rows
+        labels (np.array): The concatenated labels
+        segment (bool): Whether to append the segmented views
+
     Returns:
-        concatenated rows, concatenated labels ; as numpy arrays
+        (rows, labels) or (rows, labels, segmented rows, segmented labels)
+    """
+
+    if not segment:
+        return rows, labels
+
+    segmented_rows, segmented_labels = segment_svm_data(rows, labels)
+
+    return rows, labels, segmented_rows, segmented_labels
+
+def _fill_preallocated(results, concat_rows_np, concat_labels_np):
     """
+    Copies per-file (rows, labels) results into the preallocated
+    concatenated arrays, in order, and returns the total rows written.
 
-    concat_rows = []
-    concat_labels = []
+    Args:
+        results: Iterable of (rows, labels) per-file numpy array pairs
+        concat_rows_np (np.array): Preallocated output rows
+        concat_labels_np (np.array): Preallocated output labels
 
-    for filename in filenames:
-        temp_rows, temp_labels = read_svm_file(filename, num_features)
+    Returns:
+        Number of rows written
+    """
 
-        concat_rows.append(temp_rows)
-        concat_labels.append(temp_labels)
+    offset = 0
 
-    concat_rows_np = np.concatenate(concat_rows)
-    cocnat_labels_np = np.concatenate(concat_labels)
+    for rows, labels in results:
+        num_rows = rows.shape[0]
+        concat_rows_np[offset:offset + num_rows] = rows
+        concat_labels_np[offset:offset + num_rows] = labels
+        offset += num_rows
 
-    return concat_rows_np, cocnat_labels_np
+    return offset
+
+def read_concat_svm_files_cached(filenames, num_features, sparse=False, segment=False, cache_dir="cache"):
+    """
+    Cached front-end for read_concat_svm_files. Parsing the SVM text is
+    ~50x slower than reading a binary array back, so the concatenated
+    arrays are saved to .npy/.npz files keyed on the file list, their
+    modification times, and the feature count. Later runs over the same
+    input memory-map the cached arrays and skip the parse entirely.
+
+    Args:
+        filenames (list(string)): Filenames of the SVM files to read and concatenate
+        num_features (int): The number of features per row
+        sparse (bool): Whether to keep the rows in CSR format
+        cache_dir (string): Directory in which to store the cached arrays
+
+    Returns:
+        concatenated rows, concatenated labels ; the labels as a numpy
+        array, the rows as a numpy array or a CSR matrix when sparse
+    """
+
+    cache_key_source = repr((sorted((os.path.abspath(f), os.path.getmtime(f)) for f in filenames), num_features, sparse))
+    cache_key = hashlib.md5(cache_key_source.encode()).hexdigest()
+
+    rows_path = os.path.join(cache_dir, f'{cache_key}_X.npz' if sparse else f'{cache_key}_X.npy')
+    labels_path = os.path.join(cache_dir, f'{cache_key}_y.npy')
+
+    if os.path.isfile(rows_path) and os.path.isfile(labels_path):
+        if sparse:
+            return _with_segments(scipy.sparse.load_npz(rows_path), np.load(labels_path, mmap_mode="r"), segment)
+
+        # Memory-map the cached arrays so the data streams from disk on demand
+        return _with_segments(np.load(rows_path, mmap_mode="r"), np.load(labels_path, mmap_mode="r"), segment)
+
+    rows, labels = read_concat_svm_files(filenames, num_features, sparse=sparse)
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    if sparse:
+        scipy.sparse.save_npz(rows_path, rows)
+    else:
+        np.save(rows_path, rows)
+
+    np.save(labels_path, labels)
+
+    return _with_segments(rows, labels, segment)
+
+def count_svm_samples(filename):
+    """
+    Counts the number of segmented samples in the SVM file with the
+    passed name without parsing any values. A sample starts on every
+    row whose label is the segment marker 1, so the count only needs
+    the first byte of each line; the scan is a few vectorized numpy
+    comparisons over the memory-mapped bytes. Assumes integer-formatted
+    labels, as in the project's data files.
+
+    Args:
+        filename (string): The path of the SVM file
+
+    Returns:
+        Number of segmented samples in the file
+    """
+
+    if os.path.getsize(filename) == 0:
+        return 0
+
+    with open(filename, "rb") as svm_file:
+        mapped = mmap.mmap(svm_file.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = np.frombuffer(mapped, dtype=np.uint8)
+
+        line_starts = np.concatenate(([0], np.flatnonzero(buf == ord("\n")) + 1))
+        line_starts = line_starts[line_starts < buf.size - 1]
+
+        num_samples = int(np.count_nonzero(
+            (buf[line_starts] == ord("1")) & ((buf[line_starts + 1] == ord(" ")) | (buf[line_starts + 1] == ord("\t")))))
+
+        # Release the exported buffer before closing the map
+        del buf, line_starts
+        mapped.close()
+
+    return num_samples
+
+def as_shared_memmap(array, prefix="clas12ai_"):
+    """
+    Dumps the passed array to a .npy file on shared memory (/dev/shm,
+    falling back to the default temporary directory) and returns a
+    read-only memory map of it. joblib workers then share the mapped
+    pages instead of each receiving a pickled copy of the full array,
+    which is what lets n_jobs=-1 model fitting scale with cores. The
+    backing file is removed at interpreter exit.
+
+    Args:
+        array (np.array): The array to back with shared memory
+        prefix (string): Filename prefix for the backing file
+
+    Returns:
+        Read-only np.memmap view of the array
+    """
+
+    shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+    handle, path = tempfile.mkstemp(suffix=".npy", prefix=prefix, dir=shm_dir)
+    os.close(handle)
+
+    np.save(path, array)
+    atexit.register(os.remove, path)
+
+    return np.load(path, mmap_mode="r")
 
 def get_total_samples(labels):
     """
@@ -81,35 +321,36 @@ def get_total_samples(labels):
 def segment_svm_data(rows, labels):
     """
     Segments the passed SVM data (rows, labels) as per the instructions
-    given by Gagik. Complexity is O(N). The rows must be in dense format.
-    
+    given by Gagik. The segment boundaries are located with a single
+    vectorized scan of the labels and the segments are views into the
+    passed arrays. Rows before the first segment marker are dropped,
+    as before.
+
     Args:
-        rows (np.array): The rows of the SVM data in a numpy array
+        rows (np.array): The rows of the SVM data in a numpy array or CSR matrix
         labels (np.labels): The labels of the SVM data in a numpy array
-    
+
     Returns:
-        Segmented rows, segmented labels as numpy arrays
+        Segmented rows, segmented labels as lists of numpy arrays
     """
 
-    segmented_labels = []
-    segmented_rows = []
-    
-    start_index = -1
-    for current_index, val in enumerate(labels):
-       if val == 1:
-        if start_index == -1:
-            start_index = current_index
-        else:
-            segmented_labels.append(labels[start_index:current_index])
-            segmented_rows.append(rows[start_index:current_index])
-            
-            start_index = current_index
+    labels = np.asarray(labels)
+    segment_starts = np.flatnonzero(labels == 1)
+
+    if segment_starts.size == 0:
+        return [], []
+
+    first_start = segment_starts[0]
+    split_points = segment_starts[1:] - first_start
+
+    segmented_labels = np.split(labels[first_start:], split_points)
+
+    if scipy.sparse.issparse(rows):
+        segment_ends = np.append(segment_starts[1:], labels.size)
+        segmented_rows = [rows[start:end] for start, end in zip(segment_starts, segment_ends)]
+    else:
+        segmented_rows = np.split(rows[first_start:], split_points)
 
-    # Add last segmented sample
-    total_labels = labels.size
-    segmented_labels.append(labels[start_index:total_labels])
-    segmented_rows.append(rows[start_index:total_labels])
-        
     return segmented_rows, segmented_labels
 
 ################################################## #############################
@@ -0,0 +1,160 @@
+#############################################################################
+# Optional numba-accelerated LIBSVM parser. When numba is installed the
+# tokenizer below is JIT-compiled into a scalar loop over the raw bytes of
+# a file and writes straight into preallocated output arrays; svm_utils
+# falls back to the scikit-learn parser when numba is not importable.
+#############################################################################
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    def njit(*args, **kwargs):
+        # No-op decorator so the module still imports without numba
+        def wrap(func):
+            return func
+        return wrap
+
+@njit(cache=True)
+def _parse_int(buf, i):
+    """
+    Parses an unsigned integer from the byte buffer starting at i.
+    Returns the value and the index of the first byte after it.
+    """
+
+    n = buf.size
+    value = 0
+
+    while i < n and 48 <= buf[i] <= 57:
+        value = value * 10 + (buf[i] - 48)
+        i += 1
+
+    return value, i
+
+@njit(cache=True)
+def _parse_float(buf, i):
+    """
+    Parses a floating point number (sign, fraction, and exponent are
+    all optional) from the byte buffer starting at i. Returns the
+    value and the index of the first byte after it.
+    """
+
+    n = buf.size
+
+    sign = 1.0
+    if i < n and (buf[i] == 43 or buf[i] == 45):
+        if buf[i] == 45:
+            sign = -1.0
+        i += 1
+
+    value = 0.0
+    while i < n and 48 <= buf[i] <= 57:
+        value = value * 10.0 + (buf[i] - 48)
+        i += 1
+
+    if i < n and buf[i] == 46:
+        i += 1
+        scale = 0.1
+        while i < n and 48 <= buf[i] <= 57:
+            value += (buf[i] - 48) * scale
+            scale *= 0.1
+            i += 1
+
+    if i < n and (buf[i] == 101 or buf[i] == 69):
+        i += 1
+        exp_sign = 1
+        if i < n and (buf[i] == 43 or buf[i] == 45):
+            if buf[i] == 45:
+                exp_sign = -1
+            i += 1
+        exponent, i = _parse_int(buf, i)
+        value *= 10.0 ** (exp_sign * exponent)
+
+    return sign * value, i
+
+@njit(cache=True)
+def parse_libsvm_bytes(buf, num_features, out_rows, out_labels):
+    """
+    Parses LIBSVM-formatted bytes into the preallocated out_rows and
+    out_labels arrays. Feature indices in the input must be 1-based,
+    matching the zero_based=False contract of the scikit-learn
+    fallback parser; an index of 0 raises so corrupt or 0-based input
+    fails loudly instead of silently dropping a column.
+
+    Args:
+        buf (np.array): The file contents as a uint8 numpy array
+        num_features (int): The number of features per row
+        out_rows (np.array): Preallocated (num_rows, num_features) output
+        out_labels (np.array): Preallocated (num_rows,) output
+
+    Returns:
+        Number of rows parsed
+    """
+
+    n = buf.size
+    i = 0
+    row = 0
+
+    while i < n:
+        # Skip empty lines and stray carriage returns
+        while i < n and (buf[i] == 10 or buf[i] == 13 or buf[i] == 32 or buf[i] == 9):
+            i += 1
+        if i >= n:
+            break
+
+        label, i = _parse_float(buf, i)
+        out_labels[row] = label
+
+        while i < n and buf[i] != 10:
+            while i < n and (buf[i] == 32 or buf[i] == 9 or buf[i] == 13):
+                i += 1
+            if i >= n or buf[i] == 10:
+                break
+
+            index, i = _parse_int(buf, i)
+            if i < n and buf[i] == 58:
+                i += 1
+            value, i = _parse_float(buf, i)
+
+            if index == 0:
+                raise ValueError("Feature index 0 found; SVM input must use 1-based indices")
+
+            if index <= num_features:
+                out_rows[row, index - 1] = value
+
+        row += 1
+
+    return row
+
+def read_svm_file_njit(filename, num_features):
+    """
+    Reads the SVM file with the passed name through the JIT-compiled
+    parser, returning dense float32 rows and the labels.
+
+    Args:
+        filename (string): The path of the SVM file
+        num_features (int): The number of features per row
+
+    Returns:
+        dense rows, labels ; as numpy arrays
+    """
+
+    with open(filename, "rb") as svm_file:
+        data = svm_file.read()
+
+    buf = np.frombuffer(data, dtype=np.uint8)
+
+    max_rows = data.count(b"\n")
+    if data and not data.endswith(b"\n"):
+        max_rows += 1
+
+    rows = np.zeros((max_rows, num_features), dtype=np.float32)
+    labels = np.empty(max_rows, dtype=np.float32)
+
+    num_rows = parse_libsvm_bytes(buf, num_features, rows, labels)
+
+    return rows[:num_rows], labels[:num_rows]
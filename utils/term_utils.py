@@ -0,0 +1,30 @@
+#############################################################################
+# This file contains helpers for terminal output. Color is only emitted
+# when stdout is an interactive terminal and NO_COLOR is unset, so batch
+# and piped runs are not littered with ANSI escapes and skip the per-call
+# escape-string allocations entirely.
+#############################################################################
+
+import os
+import sys
+from termcolor import colored
+
+USE_COLOR = sys.stdout.isatty() and os.environ.get("NO_COLOR") is None
+
+def c(text, color):
+    """
+    Returns the passed text wrapped in ANSI color codes when color
+    output is enabled, or unchanged otherwise.
+
+    Args:
+        text (string): The text to colorize
+        color (string): The termcolor color name
+
+    Returns:
+        The text, colorized when appropriate
+    """
+
+    if USE_COLOR:
+        return colored(text, color)
+
+    return text